@@ -13,34 +13,70 @@ Features:
 - Command-line configuration
 """
 
-import argparse
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import hashlib
+import html
+import importlib
+import importlib.util
 import json
+import mmap
 import os
+import re
+import signal
+import socket
+import string
 import sys
-import tempfile
 import time
-import webbrowser
 import subprocess
 import threading
-import http.server
-import socketserver
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, AsyncIterator, FrozenSet, Tuple
 from dataclasses import dataclass
-from urllib.parse import urlparse
 
-# Third-party imports with fallbacks
-try:
-    import requests
-    from PIL import Image
-    import pyperclip
-    import mss
-    from flask import Flask, request, jsonify, render_template_string
-    from dotenv import load_dotenv
-except ImportError as e:
-    print(f"❌ Missing required library: {e}")
-    print("📦 Please run: ./setup_venv.sh")
-    sys.exit(1)
+if TYPE_CHECKING:
+    import argparse
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.background import BackgroundTask
+    from starlette.responses import JSONResponse, Response, StreamingResponse
+    from starlette.routing import Route
+
+
+def _print_lines(lines: List[str]):
+    """Print a block of status lines with a single write, so it can't interleave with other threads."""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+# Third-party modules the app can't run without, checked once by main()
+_REQUIRED_MODULES = ('dotenv', 'requests', 'httpx', 'starlette', 'uvicorn')
+
+
+def _require(name: str):
+    """Import a required third-party module on first use.
+    
+    Heavy dependencies are loaded lazily so that e.g. --help or a text-only
+    session never pays for them. This may run on worker threads, so a missing
+    module raises ImportError rather than exiting; main() checks up front.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        raise ImportError(f"Missing required library: {e} (run ./setup_venv.sh)") from e
+
+
+def _check_dependencies():
+    """Exit with setup hints if a required library is not installed."""
+    missing = [name for name in _REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"❌ Missing required library: {', '.join(missing)}")
+        print("📦 Please run: ./setup_venv.sh")
+        sys.exit(1)
 
 
 @dataclass
@@ -58,9 +94,56 @@ class Config:
         self.screenshot_dir.mkdir(exist_ok=True)
         self.chat_history_dir.mkdir(exist_ok=True)
     
+    @property
+    def browser_pidfile(self) -> Path:
+        """File holding the pid of the browser launched by a previous session."""
+        return self.chat_history_dir / 'browser.pid'
+    
+    def _running_browser_pid(self) -> Optional[int]:
+        """Return the pid of the browser from a previous session if it is still running.
+        
+        A live pid alone may belong to an unrelated process after a reboot or pid
+        reuse, so its command line must mention the configured browser. Wrappers
+        often exec the real binary (yandex-browser -> .../yandex_browser), so
+        names are compared without case or punctuation. A stale pidfile is removed.
+        """
+        def normalize(text: str) -> str:
+            return re.sub(r'[^a-z0-9]', '', text.lower())
+        
+        try:
+            pid = int(self.browser_pidfile.read_text().strip())
+            cmdline = Path(f'/proc/{pid}/cmdline').read_bytes().decode(errors='replace')
+        except (OSError, ValueError):
+            cmdline = ''
+        
+        if cmdline and normalize(Path(self.browser).name) in normalize(cmdline):
+            return pid
+        with contextlib.suppress(OSError):
+            self.browser_pidfile.unlink()
+        return None
+    
+    def launch_browser(self, url: str):
+        """Open url in the configured browser, reusing a running instance when possible."""
+        pid = self._running_browser_pid()
+        
+        popen_kwargs = dict(
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        if pid:
+            # The running instance receives the URL, no new profile load
+            subprocess.Popen([self.browser, '--new-tab', url], **popen_kwargs)
+        else:
+            process = subprocess.Popen([self.browser, url], **popen_kwargs)
+            self.browser_pidfile.write_text(str(process.pid))
+    
     @classmethod
     def from_args(cls, args: argparse.Namespace) -> 'Config':
         """Create config from command line arguments."""
+        load_dotenv = _require('dotenv').load_dotenv
+        
         # Load environment variables from .env file
         env_file = Path(__file__).parent / '.env'
         if env_file.exists():
@@ -109,6 +192,10 @@ COPYQ_CHAT_PORT=8085
 class ScreenshotCapture:
     """Modern screenshot capture with multiple fallback methods."""
     
+    # Shared mss grabber; opening the display is the expensive part of a capture
+    _sct = None
+    _sct_lock = threading.Lock()
+    
     @staticmethod
     def capture_screenshot() -> Optional[str]:
         """Capture screenshot using the best available method."""
@@ -136,19 +223,33 @@ class ScreenshotCapture:
         print("❌ All screenshot methods failed")
         return None
     
-    @staticmethod
-    def _capture_with_mss(filepath: Path) -> bool:
+    @classmethod
+    def _get_sct(cls):
+        """Return the process-wide mss instance, creating it on first use."""
+        if cls._sct is None:
+            import mss
+            cls._sct = mss.mss()
+        return cls._sct
+    
+    @classmethod
+    def _capture_with_mss(cls, filepath: Path) -> bool:
         """Capture using mss (fastest method)."""
         try:
-            with mss.mss() as sct:
+            # A missing mss simply falls through to the next capture method
+            import mss.tools
+            
+            # mss handles are not thread-safe
+            with cls._sct_lock:
+                sct = cls._get_sct()
                 # Capture the entire screen
                 monitor = sct.monitors[1]  # Primary monitor
                 screenshot = sct.grab(monitor)
-                
-                # Convert to PIL Image and save
-                img = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
-                img.save(filepath)
-                return filepath.exists()
+            
+            # Encode the raw RGB buffer straight to PNG, no PIL round-trip. Encoding sits
+            # on the capture path and the file is only uploaded once (it stays on disk
+            # afterwards), so fast deflate beats a smaller file
+            mss.tools.to_png(screenshot.rgb, screenshot.size, level=1, output=str(filepath))
+            return filepath.exists()
         except Exception:
             return False
     
@@ -189,11 +290,80 @@ class ScreenshotCapture:
 class TextCapture:
     """Text capture from selection and clipboard."""
     
+    # X display and requestor window, opened once per process
+    _xlib = None
+    
+    @classmethod
+    def _get_xlib(cls):
+        """Return the shared (display, window) pair for selection requests."""
+        if cls._xlib is None:
+            from Xlib import X, display
+            xdisplay = display.Display()
+            window = xdisplay.screen().root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+            cls._xlib = (xdisplay, window)
+        return cls._xlib
+    
+    @classmethod
+    def _get_selected_text_xlib(cls) -> Optional[str]:
+        """Read the primary selection over the X protocol, without spawning a process.
+        
+        Raises TimeoutError if the selection owner doesn't answer, so the
+        caller can fall back to xclip/xsel.
+        """
+        xdisplay, window = cls._get_xlib()
+        selection = xdisplay.intern_atom('PRIMARY')
+        
+        # Older clients only serve Latin-1 STRING, so ask for that if UTF-8 is refused
+        for target_name, encoding in (('UTF8_STRING', 'utf-8'), ('STRING', 'latin-1')):
+            value = cls._convert_selection(xdisplay, window, selection, target_name)
+            if value is not None:
+                if isinstance(value, bytes):
+                    value = value.decode(encoding, errors='replace')
+                return value.strip() or None
+        
+        return None
+    
+    @staticmethod
+    def _convert_selection(xdisplay, window, selection: int, target_name: str):
+        """Ask the selection owner for one target; None if there is no owner or it refuses."""
+        from Xlib import X
+        
+        target = xdisplay.intern_atom(target_name)
+        prop = xdisplay.intern_atom('XSEL_DATA')
+        
+        # Ask the selection owner to convert it onto our window
+        window.convert_selection(selection, target, prop, X.CurrentTime)
+        xdisplay.flush()
+        
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            if not xdisplay.pending_events():
+                time.sleep(0.005)
+                continue
+            
+            event = xdisplay.next_event()
+            if event.type != X.SelectionNotify or event.selection != selection or event.target != target:
+                continue
+            if event.property == X.NONE:
+                return None  # No owner or conversion refused
+            
+            data = window.get_full_property(prop, X.AnyPropertyType)
+            window.delete_property(prop)
+            return data.value if data is not None else None
+        
+        raise TimeoutError(f"selection owner did not answer {target_name} request")
+    
     @staticmethod
     def get_selected_text() -> Optional[str]:
         """Get currently selected text (primary selection)."""
         try:
-            # Try xclip first (primary selection)
+            # Talk to the X server directly when python-xlib is available
+            return TextCapture._get_selected_text_xlib()
+        except Exception:
+            pass
+        
+        try:
+            # Try xclip next (primary selection)
             result = subprocess.run([
                 'xclip', '-selection', 'primary', '-o'
             ], capture_output=True, text=True, timeout=2)
@@ -220,6 +390,7 @@ class TextCapture:
     def get_clipboard_text() -> Optional[str]:
         """Get clipboard text."""
         try:
+            import pyperclip
             return pyperclip.paste()
         except:
             return None
@@ -235,83 +406,256 @@ class TextCapture:
         return clipboard or ""
 
 
+@functools.lru_cache(maxsize=None)
+def _http_session():
+    """Return the process-wide pooled requests session, created on first use.
+    
+    Every uploader shares it, so retries, fallbacks and later uploads reuse
+    already established keep-alive TLS connections.
+    """
+    requests = _require('requests')
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=None),
+    )
+    session.mount('https://', adapter)
+    return session
+
+
+class _MultipartFileBody:
+    """multipart/form-data request body with a single file field.
+    
+    The file is read from a memory map chunk by chunk as the request is sent,
+    so it is never copied into memory as a whole. tell()/seek() let urllib3
+    rewind the body when it retries a request.
+    """
+    
+    def __init__(self, field: str, filename: str, content_type: str, data: mmap.mmap):
+        boundary = os.urandom(16).hex()
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        head = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        self._parts = [head, data, tail]
+        self._length = sum(len(part) for part in self._parts)
+        self._pos = 0
+    
+    def __len__(self) -> int:
+        return self._length
+    
+    def tell(self) -> int:
+        return self._pos
+    
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._length}[whence]
+        self._pos = max(0, min(self._length, base + offset))
+        return self._pos
+    
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length - self._pos
+        
+        chunks = []
+        part_start = 0
+        for part in self._parts:
+            part_end = part_start + len(part)
+            if size > 0 and part_start <= self._pos < part_end:
+                offset = self._pos - part_start
+                chunk = part[offset:offset + size]
+                chunks.append(chunk)
+                self._pos += len(chunk)
+                size -= len(chunk)
+            part_start = part_end
+        return b''.join(chunks)
+
+
+# Error words an upload service may return in place of a URL
+_URL_ERROR_RE = re.compile(r'error|failed|invalid', re.IGNORECASE)
+
+
 class ImageUploader:
     """Upload images to temporary hosting services."""
     
-    @staticmethod
-    def upload_image(filepath: str) -> Optional[str]:
-        """Upload image and return public URL."""
-        services = [
-            ImageUploader._upload_to_0x0,
-            ImageUploader._upload_to_fileio,
-            ImageUploader._upload_to_tmpfiles
-        ]
-        
-        for service in services:
-            try:
-                url = service(filepath)
-                if url:
-                    print(f"📤 Image uploaded: {url[:50]}...")
-                    return url
-            except Exception as e:
-                print(f"⚠️ Upload service failed: {e}")
-                continue
+    # How long an uploaded URL is reused for an identical screenshot (seconds), per
+    # host and well under its retention: tmpfiles.org deletes uploads after an hour.
+    # Hosts not listed (file.io, whose links die after one download) aren't cached
+    CACHE_TTLS = {
+        'https://0x0.st/': 3600,
+        'https://tmpfiles.org/': 900,
+    }
+    
+    def __init__(self, cache_file: Optional[Path] = None):
+        self.session = _http_session()
         
-        print("❌ All upload services failed")
-        return None
+        # Content hash -> (upload time, URL), persisted across runs in cache_file
+        self.cache_file = cache_file
+        self._upload_cache: Dict[str, Tuple[float, str]] = self._load_cache()
+    
+    def _load_cache(self) -> Dict[str, Tuple[float, str]]:
+        """Load unexpired entries of the upload cache."""
+        if self.cache_file is None:
+            return {}
+        now = time.time()
+        try:
+            entries = json.loads(self.cache_file.read_text())
+            return {digest: (ts, url) for digest, (ts, url) in entries.items() if now - ts < self._cache_ttl(url)}
+        except (OSError, ValueError, TypeError, AttributeError):
+            # Unreadable or malformed cache, start over
+            return {}
+    
+    def _save_cache(self):
+        """Persist the upload cache."""
+        if self.cache_file is None:
+            return
+        # Other hotkey processes share the file, so swap in a complete copy
+        tmp_path = self.cache_file.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            tmp_path.write_text(json.dumps(self._upload_cache))
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"⚠️ Failed to save upload cache: {e}")
+    
+    @classmethod
+    def _cache_ttl(cls, url: str) -> float:
+        """Return how long url may be reused, 0 if it must not be cached."""
+        for prefix, ttl in cls.CACHE_TTLS.items():
+            if url.startswith(prefix):
+                return ttl
+        return 0
     
     @staticmethod
-    def _upload_to_0x0(filepath: str) -> Optional[str]:
+    def _file_digest(filepath: str) -> str:
+        """Hash file contents in chunks."""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def upload_image(self, filepath: str) -> Optional[str]:
+        """Upload image and return public URL, reusing the URL of an identical recent upload."""
+        digest = self._file_digest(filepath)
+        cached = self._upload_cache.get(digest)
+        if cached and time.time() - cached[0] < self._cache_ttl(cached[1]):
+            print(f"📤 Reusing uploaded image: {cached[1][:50]}...")
+            return cached[1]
+        
+        url = self._upload_to_first_service(filepath)
+        if url and self._cache_ttl(url):
+            self._upload_cache[digest] = (time.time(), url)
+            self._save_cache()
+        return url
+    
+    def _upload_to_first_service(self, filepath: str) -> Optional[str]:
+        """Upload to the first service that returns a public URL."""
+        # 0x0.st and tmpfiles.org keep serving a link after it is fetched, so race
+        # those two. file.io links die after the first download, so it only runs
+        # if both of them fail
+        url = self._race_services(filepath, [self._upload_to_0x0, self._upload_to_tmpfiles])
+        if url is None:
+            url = self._upload_to_fileio(filepath)
+        
+        if url:
+            print(f"📤 Image uploaded: {url[:50]}...")
+        else:
+            print("❌ All upload services failed")
+        return url
+    
+    @staticmethod
+    def _race_services(filepath: str, services: List) -> Optional[str]:
+        """Upload to several services at once and return the first URL."""
+        # A stalled service never delays the others
+        executor = ThreadPoolExecutor(max_workers=len(services))
+        futures = [executor.submit(service, filepath) for service in services]
+        try:
+            for future in as_completed(futures, timeout=15):
+                try:
+                    url = future.result()
+                    if url:
+                        return url
+                except Exception as e:
+                    print(f"⚠️ Upload service failed: {e}")
+                    continue
+        except FuturesTimeoutError:
+            print("⚠️ Upload services timed out")
+        finally:
+            # Don't wait for the losing upload
+            executor.shutdown(wait=False, cancel_futures=True)
+        return None
+    
+    def _post_file(self, url: str, filepath: str):
+        """POST a file as the multipart 'file' field, streamed from a memory map."""
+        with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            body = _MultipartFileBody('file', Path(filepath).name, 'image/png', data)
+            return self.session.post(url, data=body, headers={'Content-Type': body.content_type}, timeout=10)
+    
+    def _upload_to_0x0(self, filepath: str) -> Optional[str]:
         """Upload to 0x0.st (most reliable)."""
         try:
-            import subprocess
-            result = subprocess.run([
-                'curl', '-s', '-F', f'file=@{filepath}', 'https://0x0.st'
-            ], capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                url = result.stdout.strip()
+            response = self._post_file('https://0x0.st', filepath)
+            if response.status_code == 200:
+                url = response.text.strip()
                 # Check if URL is valid (not an error message)
-                if url and url.startswith('https://') and not any(word in url.lower() for word in ['error', 'failed', 'invalid']):
+                if url.startswith('https://') and not _URL_ERROR_RE.search(url):
                     return url
         except Exception as e:
             print(f"⚠️ 0x0.st upload failed: {e}")
         return None
     
-    @staticmethod
-    def _upload_to_fileio(filepath: str) -> Optional[str]:
+    def _upload_to_fileio(self, filepath: str) -> Optional[str]:
         """Upload to file.io."""
         try:
-            with open(filepath, 'rb') as f:
-                response = requests.post('https://file.io', files={'file': f}, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    link = data.get('link')
-                    if link and link != 'null':
-                        return link
+            response = self._post_file('https://file.io', filepath)
+            if response.status_code == 200:
+                data = response.json()
+                link = data.get('link')
+                if link and link != 'null':
+                    return link
         except Exception as e:
             print(f"⚠️ file.io upload failed: {e}")
         return None
     
-    @staticmethod
-    def _upload_to_tmpfiles(filepath: str) -> Optional[str]:
+    def _upload_to_tmpfiles(self, filepath: str) -> Optional[str]:
         """Upload to tmpfiles.org."""
         try:
-            with open(filepath, 'rb') as f:
-                response = requests.post('https://tmpfiles.org/api/v1/upload', files={'file': f}, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    url = data.get('data', {}).get('url')
-                    if url and url != 'null':
-                        # Convert http to https for better compatibility
-                        if url.startswith('http://'):
-                            url = url.replace('http://', 'https://', 1)
-                        return url
+            response = self._post_file('https://tmpfiles.org/api/v1/upload', filepath)
+            if response.status_code == 200:
+                data = response.json()
+                url = data.get('data', {}).get('url')
+                if url and url != 'null':
+                    # Convert http to https for better compatibility
+                    if url.startswith('http://'):
+                        url = url.replace('http://', 'https://', 1)
+                    return url
         except Exception as e:
             print(f"⚠️ tmpfiles.org upload failed: {e}")
         return None
 
 
+# Models that accept image inputs
+_MULTIMODAL_MODELS: FrozenSet[str] = frozenset({
+    'anthropic/claude-3.5-sonnet',
+    'anthropic/claude-3.5-haiku',
+    'anthropic/claude-3-haiku',
+    'anthropic/claude-3-opus',
+    'openai/gpt-4o',
+    'openai/gpt-4o-mini',
+    'openai/chatgpt-4o-latest',
+    'meta-llama/llama-3.2-90b-vision-instruct',
+    'meta-llama/llama-3.2-11b-vision-instruct',
+    'x-ai/grok-2-vision-1212',
+    'openrouter/sonoma-sky-alpha',
+})
+
+
 class OpenRouterAPI:
     """OpenRouter API client with fallback models and better error handling."""
     
@@ -320,6 +664,20 @@ class OpenRouterAPI:
         self.model = model
         self.base_url = "https://openrouter.ai/api/v1/chat/completions"
         
+        httpx = _require('httpx')
+        # Pooled keep-alive client shared by validation and every chat turn
+        self.http = httpx.AsyncClient(
+            headers={
+                'Authorization': f'Bearer {self.api_key}',
+                'Content-Type': 'application/json'
+            },
+            timeout=30,
+            transport=httpx.AsyncHTTPTransport(
+                retries=2,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+            ),
+        )
+        
         # Fallback models in order of preference (free and paid)
         self.fallback_models = [
             'anthropic/claude-3.5-haiku',  # Reliable, fast
@@ -328,18 +686,14 @@ class OpenRouterAPI:
             'meta-llama/llama-3.2-11b-vision-instruct',  # Another option
             'anthropic/claude-3-haiku'      # Backup
         ]
-        
-        # Validate API key on initialization
-        self._validate_api_key()
     
-    def _validate_api_key(self):
-        """Validate API key by making a test request."""
+    async def aclose(self):
+        """Close pooled connections."""
+        await self.http.aclose()
+    
+    async def validate_api_key(self):
+        """Validate API key by making a test request (also warms the connection pool)."""
         try:
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            }
-            
             # Simple test request
             data = {
                 'model': 'anthropic/claude-3.5-haiku',
@@ -347,7 +701,7 @@ class OpenRouterAPI:
                 'stream': False
             }
             
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=10)
+            response = await self.http.post(self.base_url, json=data, timeout=10)
             
             if response.status_code == 401:
                 print("❌ Invalid API key! Please check your OpenRouter API key.")
@@ -365,7 +719,7 @@ class OpenRouterAPI:
             print(f"⚠️ API validation failed: {e}")
             return True  # Continue anyway
     
-    def chat_completion(self, messages: List[Dict[str, Any]], image_url: Optional[str] = None) -> Optional[str]:
+    async def chat_completion(self, messages: List[Dict[str, Any]], image_url: Optional[str] = None) -> Optional[str]:
         """Send chat completion request with fallback models."""
         
         # Try primary model first, then fallbacks
@@ -373,7 +727,7 @@ class OpenRouterAPI:
         
         for model in models_to_try:
             try:
-                result = self._try_model(model, messages, image_url)
+                result = await self._try_model(model, messages, image_url)
                 if result:
                     if model != self.model:
                         print(f"✅ Successfully used fallback model: {model}")
@@ -385,66 +739,84 @@ class OpenRouterAPI:
         print("❌ All models failed")
         return None
     
-    def _try_model(self, model: str, messages: List[Dict[str, Any]], image_url: Optional[str] = None) -> Optional[str]:
-        """Try a specific model."""
-        headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
+    async def chat_completion_stream(self, messages: List[Dict[str, Any]], image_url: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream chat completion tokens, falling back to the next model until one responds."""
         
-        # Check if model supports multimodal (images)
-        multimodal_models = [
-            'anthropic/claude-3.5-sonnet',
-            'anthropic/claude-3.5-haiku',
-            'anthropic/claude-3-haiku',
-            'anthropic/claude-3-opus',
-            'openai/gpt-4o',
-            'openai/gpt-4o-mini',
-            'openai/chatgpt-4o-latest',
-            'meta-llama/llama-3.2-90b-vision-instruct',
-            'meta-llama/llama-3.2-11b-vision-instruct',
-            'x-ai/grok-2-vision-1212',
-            'openrouter/sonoma-sky-alpha'
-        ]
+        # Try primary model first, then fallbacks
+        models_to_try = [self.model] + [m for m in self.fallback_models if m != self.model]
         
-        # Prepare messages with image if available and model supports it
-        if image_url and messages and model in multimodal_models:
-            first_message = messages[0]
-            if isinstance(first_message.get('content'), str):
-                first_message['content'] = [
-                    {'type': 'text', 'text': first_message['content']},
-                    {'type': 'image_url', 'image_url': {'url': image_url}}
-                ]
+        for model in models_to_try:
+            streamed = False
+            try:
+                async for token in self._stream_model(model, messages, image_url):
+                    streamed = True
+                    yield token
+                if streamed:
+                    if model != self.model:
+                        print(f"✅ Successfully used fallback model: {model}")
+                    return
+            except Exception as e:
+                if streamed:
+                    # Tokens already reached the client, a fallback would garble the reply
+                    raise
+                print(f"⚠️ Model {model} failed: {e}")
+                continue
+        
+        print("❌ All models failed")
+    
+    def _prepare_messages(self, model: str, messages: List[Dict[str, Any]], image_url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Attach the screenshot to the conversation in the form the model understands.
+        
+        Returns a new list; the caller's messages are never modified, so retries
+        with fallback models always start from the original conversation.
+        """
+        outgoing = list(messages)
+        if not image_url or not outgoing or not isinstance(outgoing[0].get('content'), str):
+            return outgoing
+        
+        first_message = dict(outgoing[0])
+        # Prepare messages with image if model supports it
+        if model in _MULTIMODAL_MODELS:
+            first_message['content'] = [
+                {'type': 'text', 'text': first_message['content']},
+                {'type': 'image_url', 'image_url': {'url': image_url}}
+            ]
             print(f"🖼️ Using multimodal mode with image: {image_url[:50]}...")
-        elif image_url:
+        else:
             # Add image URL as text description for non-multimodal models
-            first_message = messages[0]
-            if isinstance(first_message.get('content'), str):
-                first_message['content'] += f"\n\n[Screenshot available at: {image_url}]"
+            first_message['content'] += f"\n\n[Screenshot available at: {image_url}]"
             print(f"📝 Adding image URL as text description (model doesn't support multimodal)")
+        outgoing[0] = first_message
         
+        return outgoing
+    
+    @staticmethod
+    def _report_api_error(status_code: int, error_msg: str):
+        """Print an API error with a hint for the common failure cases."""
+        print(f"❌ API error {status_code}: {error_msg}")
+        
+        # Handle specific error cases
+        if status_code == 401:
+            print("🔑 Authentication failed - check your API key")
+        elif status_code == 429:
+            print("⏳ Rate limit exceeded - trying next model")
+        elif status_code == 404:
+            print("🚫 Model not found - trying next model")
+    
+    async def _try_model(self, model: str, messages: List[Dict[str, Any]], image_url: Optional[str] = None) -> Optional[str]:
+        """Try a specific model."""
         data = {
             'model': model,
-            'messages': messages,
+            'messages': self._prepare_messages(model, messages, image_url),
             'stream': False
         }
         
         print(f"🤖 Trying model: {model}")
         
-        response = requests.post(self.base_url, headers=headers, json=data, timeout=30)
+        response = await self.http.post(self.base_url, json=data)
         
         if response.status_code != 200:
-            error_msg = response.text
-            print(f"❌ API error {response.status_code}: {error_msg}")
-            
-            # Handle specific error cases
-            if response.status_code == 401:
-                print("🔑 Authentication failed - check your API key")
-            elif response.status_code == 429:
-                print("⏳ Rate limit exceeded - trying next model")
-            elif response.status_code == 404:
-                print("🚫 Model not found - trying next model")
-            
+            self._report_api_error(response.status_code, response.text)
             return None
             
         response.raise_for_status()
@@ -454,6 +826,36 @@ class OpenRouterAPI:
             return result['choices'][0]['message']['content']
         
         return None
+    
+    async def _stream_model(self, model: str, messages: List[Dict[str, Any]], image_url: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream a specific model's reply token by token from its SSE frames."""
+        data = {
+            'model': model,
+            'messages': self._prepare_messages(model, messages, image_url),
+            'stream': True
+        }
+        
+        print(f"🤖 Streaming from model: {model}")
+        
+        async with self.http.stream('POST', self.base_url, json=data) as response:
+            if response.status_code != 200:
+                error_msg = (await response.aread()).decode(errors='replace')
+                self._report_api_error(response.status_code, error_msg)
+                return
+            
+            async for line in response.aiter_lines():
+                # Skip keep-alive comments such as ": OPENROUTER PROCESSING"
+                if not line.startswith('data: '):
+                    continue
+                payload = line[len('data: '):]
+                if payload == '[DONE]':
+                    break
+                
+                choices = json.loads(payload).get('choices') or []
+                if choices:
+                    token = choices[0].get('delta', {}).get('content')
+                    if token:
+                        yield token
 
 
 class ChatHistory:
@@ -462,11 +864,23 @@ class ChatHistory:
     def __init__(self, history_dir: Path):
         self.history_dir = history_dir
     
+    @staticmethod
+    def _dumps(data: Dict[str, Any]) -> bytes:
+        """Serialize to indented JSON, using orjson when it is installed."""
+        try:
+            import orjson
+        except ImportError:
+            return json.dumps(data, indent=2).encode()
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    
     def save_session(self, session_id: str, data: Dict[str, Any]):
         """Save chat session data."""
         filepath = self.history_dir / f"session_{session_id}.json"
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Write to a temporary file and swap it in, so an interrupted save
+        # never leaves a truncated session file behind
+        tmp_path = filepath.with_suffix(f'.{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(self._dumps(data))
+        os.replace(tmp_path, filepath)
     
     def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Load chat session data."""
@@ -477,131 +891,77 @@ class ChatHistory:
         return None
 
 
-class WebChatServer:
-    """Modern web-based chat interface using Flask."""
-    
-    def __init__(self, config: Config):
-        self.config = config
-        self.api = OpenRouterAPI(config.api_key, config.model)
-        self.history = ChatHistory(config.chat_history_dir)
-        self.session_id = str(int(time.time()))
-        self.context_data = {}
-        self.app = Flask(__name__)
-        self.setup_routes()
-    
-    def setup_routes(self):
-        """Setup Flask routes."""
-        
-        @self.app.route('/')
-        def index():
-            return self.generate_chat_html()
-        
-        @self.app.route('/api/chat', methods=['POST'])
-        def chat():
-            try:
-                data = request.get_json()
-                messages = data.get('messages', [])
-                
-                # Check for exit commands
-                if messages:
-                    last_message = messages[-1].get('content', '').lower().strip()
-                    if last_message in ['bye', 'exit', 'close', 'quit']:
-                        # Schedule server shutdown
-                        def shutdown_server():
-                            time.sleep(1)  # Give time for response
-                            # Try graceful shutdown first
-                            try:
-                                import signal
-                                os.kill(os.getpid(), signal.SIGTERM)
-                            except:
-                                # Fallback to force exit
-                                os._exit(0)
-                        
-                        threading.Thread(target=shutdown_server, daemon=True).start()
-                        return jsonify({'success': True, 'response': '👋 Goodbye! Chat session ended.', 'exit': True})
-                
-                response = self.api.chat_completion(messages, self.context_data.get('image_url'))
-                
-                if response:
-                    return jsonify({'success': True, 'response': response})
-                else:
-                    return jsonify({'success': False, 'error': 'No response from API. Please check your API key or try again.'})
-                    
-            except Exception as e:
-                return jsonify({'success': False, 'error': str(e)})
-        
-        @self.app.route('/api/context', methods=['POST'])
-        def context():
-            try:
-                data = request.get_json()
-                self.context_data.update(data)
-                
-                # Save session
-                session_data = {
-                    'timestamp': time.time(),
-                    'context': self.context_data,
-                    'messages': []
-                }
-                self.history.save_session(self.session_id, session_data)
-                
-                return jsonify({'success': True})
-                
-            except Exception as e:
-                return jsonify({'success': False, 'error': str(e)})
-    
-    def generate_chat_html(self) -> str:
-        """Generate modern chat interface HTML."""
-        selected_text = self.context_data.get('selected_text', '')
-        screenshot_url = self.context_data.get('image_url', '')
-        
-        return f"""
-<!DOCTYPE html>
+def _js_string(value: str) -> str:
+    """Encode a value as a JavaScript string literal that is safe inside <script>."""
+    return json.dumps(value).replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
+
+# Markdown renderer and sanitizer, pinned and downloaded by setup_venv.sh.
+# They are served by the app itself so the page never loads scripts from a CDN
+_VENDOR_DIR = Path(__file__).resolve().parent / 'vendor'
+_VENDOR_SCRIPTS = frozenset({'markdown-it.min.js', 'purify.min.js'})
+
+
+@functools.lru_cache(maxsize=None)
+def _load_vendor_script(name: str) -> Optional[bytes]:
+    """Return a vendored script, or None if it is unknown or not installed."""
+    if name not in _VENDOR_SCRIPTS:
+        return None
+    try:
+        return (_VENDOR_DIR / name).read_bytes()
+    except OSError:
+        return None
+
+
+# Static parts of the chat page, encoded once at import time; only the small
+# context fragment in between is rendered per request
+_STATIC_HEAD = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>CopyQ Chat Assistant</title>
     <style>
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
         
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             min-height: 100vh;
             display: flex;
             flex-direction: column;
-        }}
+        }
         
-        .header {{
+        .header {
             background: rgba(255, 255, 255, 0.1);
             backdrop-filter: blur(10px);
             padding: 1rem;
             color: white;
             text-align: center;
-        }}
+        }
         
-        .context-box {{
+        .context-box {
             background: rgba(255, 255, 255, 0.9);
             margin: 1rem;
             padding: 1rem;
             border-radius: 10px;
             box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }}
+        }
         
-        .context-item {{
+        .context-item {
             margin: 0.5rem 0;
-        }}
+        }
         
-        .context-label {{
+        .context-label {
             font-weight: bold;
             color: #333;
-        }}
+        }
         
-        .chat-container {{
+        .chat-container {
             flex: 1;
             display: flex;
             flex-direction: column;
@@ -610,168 +970,177 @@ class WebChatServer:
             border-radius: 10px;
             overflow: hidden;
             box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }}
+        }
         
-        .chat-messages {{
+        .chat-messages {
             flex: 1;
             padding: 1rem;
             overflow-y: auto;
             max-height: 400px;
-        }}
+        }
         
-        .message {{
+        .message {
             margin: 0.5rem 0;
             padding: 0.75rem;
             border-radius: 10px;
             max-width: 80%;
-        }}
+        }
         
-        .message.user {{
+        .message.user {
             background: #667eea;
             color: white;
             margin-left: auto;
             text-align: right;
-        }}
+        }
         
-        .message.assistant {{
+        .message.assistant {
             background: #f0f0f0;
             color: #333;
             margin-right: auto;
-        }}
+        }
         
-        .input-container {{
+        .input-container {
             display: flex;
             padding: 1rem;
             background: white;
             border-top: 1px solid #eee;
-        }}
+        }
         
-        .input-field {{
+        .input-field {
             flex: 1;
             padding: 0.75rem;
             border: 1px solid #ddd;
             border-radius: 5px;
             margin-right: 0.5rem;
-        }}
+        }
         
-        .send-button {{
+        .send-button {
             padding: 0.75rem 1.5rem;
             background: #667eea;
             color: white;
             border: none;
             border-radius: 5px;
             cursor: pointer;
-        }}
+        }
         
-        .send-button:hover {{
+        .send-button:hover {
             background: #5a6fd8;
-        }}
+        }
         
-        .loading {{
+        .loading {
             display: none;
             text-align: center;
             padding: 1rem;
             color: #666;
-        }}
+        }
         
         /* Markdown styling */
-        .message h1, .message h2, .message h3 {{
+        .message h1, .message h2, .message h3 {
             margin: 0.5rem 0;
             color: #333;
-        }}
+        }
         
-        .message h1 {{
+        .message h1 {
             font-size: 1.5rem;
             border-bottom: 2px solid #667eea;
             padding-bottom: 0.25rem;
-        }}
+        }
         
-        .message h2 {{
+        .message h2 {
             font-size: 1.3rem;
             border-bottom: 1px solid #ddd;
             padding-bottom: 0.25rem;
-        }}
+        }
         
-        .message h3 {{
+        .message h3 {
             font-size: 1.1rem;
             color: #667eea;
-        }}
+        }
         
-        .message code {{
+        .message code {
             background: #f4f4f4;
             padding: 0.2rem 0.4rem;
             border-radius: 3px;
             font-family: 'Courier New', monospace;
             font-size: 0.9em;
-        }}
+        }
         
-        .message pre {{
+        .message pre {
             background: #f4f4f4;
             padding: 1rem;
             border-radius: 5px;
             overflow-x: auto;
             margin: 0.5rem 0;
-        }}
+        }
         
-        .message pre code {{
+        .message pre code {
             background: none;
             padding: 0;
-        }}
+        }
         
-        .message ul, .message ol {{
+        .message ul, .message ol {
             margin: 0.5rem 0;
             padding-left: 1.5rem;
-        }}
+        }
         
-        .message li {{
+        .message li {
             margin: 0.25rem 0;
-        }}
+        }
         
-        .message a {{
+        .message a {
             color: #667eea;
             text-decoration: none;
-        }}
+        }
         
-        .message a:hover {{
+        .message a:hover {
             text-decoration: underline;
-        }}
+        }
         
-        .message strong {{
+        .message strong {
             font-weight: bold;
-        }}
+        }
         
-        .message em {{
+        .message em {
             font-style: italic;
-        }}
+        }
         
-        .error-message {{
+        .error-message {
             background: #ffebee;
             color: #c62828;
             border: 1px solid #ffcdd2;
             padding: 0.75rem;
             border-radius: 5px;
             margin: 0.5rem 0;
-        }}
+        }
     </style>
 </head>
 <body>
-    <div class="header">
+""".encode()
+
+_CONTEXT_TMPL = string.Template("""    <div class="header">
         <h1>CopyQ Chat Assistant</h1>
-        <p>Session: {self.session_id} | Context: Captured</p>
+        <p>Session: ${session_id} | Context: Captured</p>
     </div>
     
     <div class="context-box">
         <div class="context-item">
-            <span class="context-label">Selected Text:</span> {selected_text or 'None'}
+            <span class="context-label">Selected Text:</span> ${selected_text_html}
         </div>
         <div class="context-item">
-            <span class="context-label">Screenshot:</span> {screenshot_url or 'None'}
+            <span class="context-label">Screenshot:</span> ${screenshot_url_html}
         </div>
         <div class="context-item">
             <span class="context-label">Available Commands:</span> <strong>bye</strong>, <strong>exit</strong>, <strong>close</strong>, <strong>quit</strong> (to end session)
         </div>
     </div>
     
+    <script>
+        const selectedText = ${selected_text_js};
+        const screenshotUrl = ${screenshot_url_js};
+    </script>
+""")
+
+_STATIC_TAIL = """    
     <div class="chat-container">
         <div class="chat-messages" id="chatMessages">
             <!-- Initial message will be added by JavaScript -->
@@ -787,96 +1156,72 @@ class WebChatServer:
         </div>
     </div>
     
+    <script src="/vendor/markdown-it.min.js"></script>
+    <script src="/vendor/purify.min.js"></script>
     <script>
-        const selectedText = `{selected_text}`;
-        const screenshotUrl = `{screenshot_url}`;
         
-        function addMessage(role, content) {{
+        function addMessage(role, content) {
             const messagesDiv = document.getElementById('chatMessages');
             const messageDiv = document.createElement('div');
-            messageDiv.className = `message ${{role}}`;
-            
-            if (role === 'user') {{
+            messageDiv.className = `message ${role}`;
+            messagesDiv.appendChild(messageDiv);
+            setMessageContent(messageDiv, role, content);
+            return messageDiv;
+        }
+        
+        function setMessageContent(messageDiv, role, content) {
+            if (role === 'user') {
                 // User messages: bold formatting
-                messageDiv.innerHTML = `<strong>${{content}}</strong>`;
-            }} else {{
+                messageDiv.innerHTML = `<strong>${escapeHtml(content)}</strong>`;
+            } else {
                 // Assistant messages: render markdown
                 messageDiv.innerHTML = renderMarkdown(content);
-            }}
+            }
             
-            messagesDiv.appendChild(messageDiv);
+            const messagesDiv = messageDiv.parentNode;
             messagesDiv.scrollTop = messagesDiv.scrollHeight;
-        }}
+        }
         
-        function renderMarkdown(text) {{
-            // Split into lines for better processing
-            let lines = text.split('\\n');
-            let result = [];
-            let inList = false;
-            
-            for (let i = 0; i < lines.length; i++) {{
-                let line = lines[i];
-                
-                // Headers
-                if (line.match(/^### (.*)$/)) {{
-                    if (inList) {{ result.push('</ul>'); inList = false; }}
-                    result.push('<h3>' + line.replace(/^### (.*)$/, '$1') + '</h3>');
-                }} else if (line.match(/^## (.*)$/)) {{
-                    if (inList) {{ result.push('</ul>'); inList = false; }}
-                    result.push('<h2>' + line.replace(/^## (.*)$/, '$1') + '</h2>');
-                }} else if (line.match(/^# (.*)$/)) {{
-                    if (inList) {{ result.push('</ul>'); inList = false; }}
-                    result.push('<h1>' + line.replace(/^# (.*)$/, '$1') + '</h1>');
-                }}
-                // Lists
-                else if (line.match(/^[-*] (.*)$/)) {{
-                    if (!inList) {{ result.push('<ul>'); inList = true; }}
-                    let content = line.replace(/^[-*] (.*)$/, '$1');
-                    result.push('<li>' + processInlineMarkdown(content) + '</li>');
-                }}
-                // Empty lines
-                else if (line.trim() === '') {{
-                    if (inList) {{ result.push('</ul>'); inList = false; }}
-                    result.push('<br>');
-                }}
-                // Regular text
-                else {{
-                    if (inList) {{ result.push('</ul>'); inList = false; }}
-                    result.push(processInlineMarkdown(line));
-                }}
-            }}
-            
-            // Close any open list
-            if (inList) {{ result.push('</ul>'); }}
+        function escapeHtml(text) {
+            return text
+                .replace(/&/g, '&amp;')
+                .replace(/</g, '&lt;')
+                .replace(/>/g, '&gt;')
+                .replace(/"/g, '&quot;');
+        }
+        
+        // markdown-it tokenizes in a single linear pass. Raw HTML in replies is
+        // disabled and the output is sanitized, so replies can't inject markup
+        const md = window.markdownit ? window.markdownit({ html: false, linkify: true, breaks: true }) : null;
+        
+        if (md) {
+            // Open links in a new tab
+            const defaultLinkOpen = md.renderer.rules.link_open ||
+                ((tokens, idx, options, env, self) => self.renderToken(tokens, idx, options));
+            md.renderer.rules.link_open = (tokens, idx, options, env, self) => {
+                tokens[idx].attrSet('target', '_blank');
+                return defaultLinkOpen(tokens, idx, options, env, self);
+            };
+        }
+        
+        function renderMarkdown(text) {
+            if (!md || !window.DOMPurify) {
+                // Vendored scripts missing: show the reply as plain text
+                return escapeHtml(text).replace(/\\n/g, '<br>');
+            }
             
-            return result.join('\\n');
-        }}
+            return DOMPurify.sanitize(md.render(text), { ADD_ATTR: ['target'] });
+        }
         
-        function processInlineMarkdown(text) {{
-            return text
-                // Bold
-                .replace(/\\*\\*(.*?)\\*\\*/g, '<strong>$1</strong>')
-                .replace(/__(.*?)__/g, '<strong>$1</strong>')
-                // Italic
-                .replace(/\\*(.*?)\\*/g, '<em>$1</em>')
-                .replace(/_(.*?)_/g, '<em>$1</em>')
-                // Code blocks
-                .replace(/```([\\s\\S]*?)```/g, '<pre><code>$1</code></pre>')
-                // Inline code
-                .replace(/`(.*?)`/g, '<code>$1</code>')
-                // Links
-                .replace(/\\[([^\\]]+)\\]\\(([^)]+)\\)/g, '<a href="$2" target="_blank">$1</a>');
-        }}
-        
-        function showLoading() {{
+        function showLoading() {
             document.getElementById('loading').style.display = 'block';
-        }}
+        }
         
-        function hideLoading() {{
+        function hideLoading() {
             document.getElementById('loading').style.display = 'none';
-        }}
+        }
         
-        function sendMessage() {{
+        function sendMessage() {
             const input = document.getElementById('messageInput');
             const message = input.value.trim();
             
@@ -891,60 +1236,101 @@ class WebChatServer:
             
             // Prepare messages for API
             const messages = [
-                {{
+                {
                     role: 'user',
-                    content: `I have selected the following text: "${{selectedText}}"
+                    content: `I have selected the following text: "${selectedText}"
                     
 I also took a screenshot of my current screen (if available).
 
 Please help me understand or discuss this content. You can ask me questions about it, explain it, or help me with any related tasks. I will be asking you questions about this content.`
-                }},
-                {{
+                },
+                {
                     role: 'user',
                     content: message
-                }}
+                }
             ];
             
-            // Send to API
-            fetch('/api/chat', {{
+            // Stream the reply, rendering tokens as they arrive
+            streamChat(messages).catch(error => {
+                hideLoading();
+                addMessage('assistant', 'Error: ' + error.message);
+            });
+        }
+        
+        async function streamChat(messages) {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
-                headers: {{
+                headers: {
                     'Content-Type': 'application/json'
-                }},
-                body: JSON.stringify({{ messages: messages }})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                hideLoading();
-                if (data.success) {{
-                    addMessage('assistant', data.response);
+                },
+                body: JSON.stringify({ messages: messages })
+            });
+            if (!response.ok) {
+                throw new Error(`Server returned ${response.status} ${response.statusText}`);
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let assistantDiv = null;
+            let reply = '';
+            let renderPending = false;
+            
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                
+                // Server-sent events are separated by a blank line
+                buffer += decoder.decode(value, { stream: true });
+                const frames = buffer.split('\\n\\n');
+                buffer = frames.pop();
+                
+                for (const frame of frames) {
+                    if (!frame.startsWith('data: ')) continue;
+                    const data = JSON.parse(frame.slice(6));
+                    
+                    if (data.token) {
+                        if (!assistantDiv) {
+                            hideLoading();
+                            assistantDiv = addMessage('assistant', '');
+                        }
+                        reply += data.token;
+                        
+                        // Re-render at most once per frame, however fast tokens arrive
+                        if (!renderPending) {
+                            renderPending = true;
+                            requestAnimationFrame(() => {
+                                renderPending = false;
+                                setMessageContent(assistantDiv, 'assistant', reply);
+                            });
+                        }
+                    } else if (data.error) {
+                        hideLoading();
+                        addMessage('assistant', 'Error: ' + data.error);
+                    }
                     
                     // Check if this is an exit command
-                    if (data.exit) {{
+                    if (data.exit) {
                         // Close browser window after a short delay
-                        setTimeout(() => {{
+                        setTimeout(() => {
                             window.close();
-                        }}, 2000);
-                    }}
-                }} else {{
-                    addMessage('assistant', 'Error: ' + data.error);
-                }}
-            }})
-            .catch(error => {{
-                hideLoading();
-                addMessage('assistant', 'Error: ' + error.message);
-            }});
-        }}
+                        }, 2000);
+                    }
+                }
+            }
+            
+            hideLoading();
+        }
         
         // Allow Enter key to send message
-        document.getElementById('messageInput').addEventListener('keypress', function(e) {{
-            if (e.key === 'Enter') {{
+        document.getElementById('messageInput').addEventListener('keypress', function(e) {
+            if (e.key === 'Enter') {
                 sendMessage();
-            }}
-        }});
+            }
+        });
         
         // Initialize welcome message
-        document.addEventListener('DOMContentLoaded', function() {{
+        document.addEventListener('DOMContentLoaded', function() {
             const welcomeMessage = `# Welcome to CopyQ Chat Assistant! 🚀
             
 I can see your **selected text** and **screenshot**. How can I help you with this content?
@@ -958,60 +1344,349 @@ I can see your **selected text** and **screenshot**. How can I help you with thi
 Just type your question and I'll respond with properly formatted markdown!`;
             
             addMessage('assistant', welcomeMessage);
-        }});
+        });
     </script>
 </body>
 </html>
-        """
+""".encode()
+
+
+class WebChatServer:
+    """Modern web-based chat interface using Starlette on uvicorn."""
+    
+    def __init__(self, config: Config):
+        # Bind the response classes module-wide once the web stack is needed,
+        # so the handlers use them directly without importing per request
+        global BackgroundTask, JSONResponse, Response, StreamingResponse
+        from starlette.background import BackgroundTask
+        from starlette.responses import JSONResponse, Response, StreamingResponse
+        
+        self.config = config
+        self.api = OpenRouterAPI(config.api_key, config.model)
+        self.history = ChatHistory(config.chat_history_dir)
+        self.session_id = f"{time.time_ns():x}"
+        self.context_data = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._save_task: Optional[asyncio.Future] = None
+        self._validate_task: Optional[asyncio.Task] = None
+        self._server = None  # uvicorn.Server, set by run()
+        self._pending_upload: Optional[Future] = None
+        self._socket: Optional[socket.socket] = None
+        applications = _require('starlette.applications')
+        self.app = applications.Starlette(routes=self.setup_routes(), lifespan=self.lifespan)
+    
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app: Starlette):
+        """Validate the API key on startup; flush state and close connections on shutdown."""
+        # The browser may already be waiting on the socket, so check the key and
+        # warm the connection pool in the background instead of delaying startup
+        self._validate_task = asyncio.create_task(self.api.validate_api_key())
+        yield
+        
+        if not self._validate_task.done():
+            self._validate_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._validate_task
+        
+        # Don't lose a context update that is still waiting to be written
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+            self.history.save_session(self.session_id, self._session_data())
+        
+        await self.api.aclose()
+    
+    def attach_upload(self, upload_future: Optional[Future]):
+        """Take the screenshot URL from an upload that may still be running."""
+        self._pending_upload = upload_future
+    
+    def _collect_upload(self):
+        """Move a finished screenshot upload into the session context."""
+        upload = self._pending_upload
+        if upload is None or not upload.done():
+            return
+        
+        self._pending_upload = None
+        try:
+            self.context_data['image_url'] = upload.result()
+        except Exception as e:
+            print(f"⚠️ Screenshot upload failed: {e}")
+            self.context_data['image_url'] = None
+        self._schedule_flush()
+    
+    async def _get_image_url(self) -> Optional[str]:
+        """Return the screenshot URL, waiting for the upload if it is still running."""
+        upload = self._pending_upload
+        if upload is not None:
+            with contextlib.suppress(Exception):
+                await asyncio.wrap_future(upload)
+            self._collect_upload()
+        return self.context_data.get('image_url')
+    
+    def setup_routes(self) -> List[Route]:
+        """Setup Starlette routes."""
+        from starlette.routing import Route
+        
+        return [
+            Route('/', self.index),
+            Route('/api/chat', self.chat, methods=['POST']),
+            Route('/api/chat/stream', self.chat_stream, methods=['POST']),
+            Route('/api/context', self.context, methods=['POST']),
+            Route('/vendor/{name}', self.vendor),
+        ]
+    
+    async def vendor(self, request: Request) -> Response:
+        script = _load_vendor_script(request.path_params['name'])
+        if script is None:
+            return Response(status_code=404)
+        return Response(script, media_type='text/javascript', headers={'Cache-Control': 'private, max-age=86400'})
+    
+    async def index(self, request: Request) -> Response:
+        self._collect_upload()
+        
+        # The page only changes with the session context, so reloads revalidate cheaply
+        context_key = (
+            self.session_id,
+            self.context_data.get('selected_text'),
+            self.context_data.get('image_url'),
+            self._pending_upload is None,
+        )
+        headers = {
+            'Cache-Control': 'private, no-cache',
+            'ETag': f'"{hash(context_key) & 0xFFFFFFFFFFFFFFFF:x}"',
+        }
+        if request.headers.get('if-none-match') == headers['ETag']:
+            return Response(status_code=304, headers=headers)
+        return Response(self.generate_chat_html(), media_type='text/html', headers=headers)
+    
+    @staticmethod
+    def _is_exit_command(messages: List[Dict[str, Any]]) -> bool:
+        """Check whether the last message asks to end the session."""
+        if messages:
+            last_message = messages[-1].get('content', '').lower().strip()
+            return last_message in ['bye', 'exit', 'close', 'quit']
+        return False
+    
+    def _request_shutdown(self):
+        """Ask the server to shut down gracefully."""
+        if self._server is not None:
+            # uvicorn finishes open connections and runs the lifespan shutdown
+            self._server.should_exit = True
+        else:
+            os.kill(os.getpid(), signal.SIGTERM)
+    
+    async def chat(self, request: Request) -> JSONResponse:
+        try:
+            data = await request.json()
+            messages = data.get('messages', [])
+            
+            # Check for exit commands, shutting down only once the goodbye is sent
+            if self._is_exit_command(messages):
+                return JSONResponse(
+                    {'success': True, 'response': '👋 Goodbye! Chat session ended.', 'exit': True},
+                    background=BackgroundTask(self._request_shutdown),
+                )
+            
+            response = await self.api.chat_completion(messages, await self._get_image_url())
+            
+            if response:
+                return JSONResponse({'success': True, 'response': response})
+            else:
+                return JSONResponse({'success': False, 'error': 'No response from API. Please check your API key or try again.'})
+                
+        except Exception as e:
+            return JSONResponse({'success': False, 'error': str(e)})
+    
+    async def chat_stream(self, request: Request) -> StreamingResponse:
+        """Stream the assistant reply to the browser as server-sent events."""
+        def sse(event: Dict[str, Any]) -> str:
+            return f"data: {json.dumps(event)}\n\n"
+        
+        try:
+            data = await request.json()
+            messages = data.get('messages', [])
+            exiting = self._is_exit_command(messages)
+            parse_error = None
+        except Exception as e:
+            messages, exiting, parse_error = [], False, f"Invalid request: {e}"
+        
+        async def events() -> AsyncIterator[str]:
+            if parse_error:
+                yield sse({'error': parse_error})
+            elif exiting:
+                yield sse({'token': '👋 Goodbye! Chat session ended.', 'exit': True})
+            else:
+                streamed = False
+                try:
+                    async for token in self.api.chat_completion_stream(messages, await self._get_image_url()):
+                        streamed = True
+                        yield sse({'token': token})
+                    if not streamed:
+                        yield sse({'error': 'No response from API. Please check your API key or try again.'})
+                except Exception as e:
+                    yield sse({'error': str(e)})
+            yield sse({'done': True})
+        
+        return StreamingResponse(
+            events(),
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache'},
+            # Shut down only after the goodbye has been streamed out
+            background=BackgroundTask(self._request_shutdown) if exiting else None,
+        )
+    
+    async def context(self, request: Request) -> JSONResponse:
+        try:
+            data = await request.json()
+            self.context_data.update(data)
+            self._schedule_flush()
+            
+            return JSONResponse({'success': True})
+            
+        except Exception as e:
+            return JSONResponse({'success': False, 'error': str(e)})
+    
+    def _session_data(self) -> Dict[str, Any]:
+        """Snapshot of the session as it is stored in the history."""
+        return {
+            'timestamp': time.time(),
+            'context': dict(self.context_data),
+            'messages': []
+        }
+    
+    def _schedule_flush(self):
+        """Coalesce rapid context updates into a single write shortly after the last one."""
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(0.5, self._flush)
+    
+    def _flush(self):
+        """Write the pending context update to the session file."""
+        self._flush_handle = None
+        # Keep a reference so the task isn't garbage collected mid-write
+        self._save_task = asyncio.ensure_future(self._save_session(self._session_data()))
+    
+    async def _save_session(self, session_data: Dict[str, Any]):
+        """Save session off the event loop."""
+        try:
+            await asyncio.to_thread(self.history.save_session, self.session_id, session_data)
+        except Exception as e:
+            print(f"⚠️ Failed to save session: {e}")
+    
+    def generate_chat_html(self) -> bytes:
+        """Generate modern chat interface HTML."""
+        selected_text = self.context_data.get('selected_text') or ''
+        screenshot_url = self.context_data.get('image_url') or ''
+        
+        context = _CONTEXT_TMPL.substitute(
+            session_id=self.session_id,
+            selected_text_html=html.escape(selected_text or 'None'),
+            screenshot_url_html=html.escape(screenshot_url or ('Uploading...' if self._pending_upload else 'None')),
+            selected_text_js=_js_string(selected_text),
+            screenshot_url_js=_js_string(screenshot_url),
+        )
+        return _STATIC_HEAD + context.encode() + _STATIC_TAIL
+    
+    def _create_socket(self) -> socket.socket:
+        """Create the listening socket on loopback with Nagle's algorithm disabled."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Inherited by accepted connections, so small JSON and SSE frames
+        # are sent immediately instead of waiting on delayed ACKs
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.bind(('127.0.0.1', self.config.port))
+        sock.listen(128)
+        return sock
+    
+    def bind(self):
+        """Bind the listening socket now, so clients can connect before run() is entered."""
+        if self._socket is None:
+            self._socket = self._create_socket()
     
     def run(self):
-        """Run the Flask server."""
-        print(f"🌐 Starting chat server on http://localhost:{self.config.port}")
+        """Run the uvicorn server."""
+        print(f"🌐 Starting chat server on http://127.0.0.1:{self.config.port}")
         
-        # Set up signal handler for graceful shutdown
-        import signal
-        def signal_handler(signum, frame):
-            print("\n👋 Received shutdown signal. Ending chat session...")
-            sys.exit(0)
+        uvicorn = _require('uvicorn')
         
-        signal.signal(signal.SIGTERM, signal_handler)
-        signal.signal(signal.SIGINT, signal_handler)
+        # uvicorn installs its own SIGINT/SIGTERM handlers and shuts down gracefully
+        self._server = uvicorn.Server(uvicorn.Config(
+            self.app,
+            loop='auto',
+            http='auto',
+        ))
         
         try:
-            self.app.run(host='localhost', port=self.config.port, debug=False)
+            self.bind()
+            self._server.run(sockets=[self._socket])
+            print("\n👋 Chat session ended.")
         except KeyboardInterrupt:
             print("\n👋 Chat session ended by user.")
         except Exception as e:
             print(f"❌ Server error: {e}")
 
 
+# Workers for the I/O-bound capture phase: screenshot, text and upload
+_CAPTURE_POOL = ThreadPoolExecutor(max_workers=3, thread_name_prefix='capture')
+
+
 class CopyQChatApp:
     """Main application class."""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, verbose: bool = False):
         self.config = config
-        self.session_id = str(int(time.time()))
+        self.verbose = verbose
+        self.session_id = f"{time.time_ns():x}"
+        self.upload_future: Optional[Future] = None
     
     def capture_context(self) -> Dict[str, Any]:
-        """Capture screenshot and text context."""
-        print("📸 Capturing screenshot...")
-        screenshot_path = ScreenshotCapture.capture_screenshot()
-        
-        print("📝 Capturing text context...")
-        selected_text = TextCapture.get_text_context()
+        """Capture screenshot and text context.
         
-        image_url = None
-        if screenshot_path:
-            print("📤 Uploading screenshot...")
-            image_url = ImageUploader.upload_image(screenshot_path)
+        Screenshot and text are captured in parallel. The screenshot upload
+        starts as soon as the file exists and keeps running in the background
+        as self.upload_future, so the browser and server don't wait for it.
+        """
+        # Progress lines from parallel workers interleave, so only show them on request
+        if self.verbose:
+            print("📸 Capturing screenshot and text context...")
+        screenshot_future = _CAPTURE_POOL.submit(ScreenshotCapture.capture_screenshot)
+        text_future = _CAPTURE_POOL.submit(TextCapture.get_text_context)
+        self.upload_future = _CAPTURE_POOL.submit(self._upload_screenshot, screenshot_future)
         
         return {
-            'selected_text': selected_text,
-            'image_url': image_url,
-            'screenshot_path': screenshot_path,
+            'selected_text': text_future.result(),
+            'image_url': None,  # Set by the server once the upload finishes
+            'screenshot_path': screenshot_future.result(),
             'timestamp': time.time()
         }
     
+    def _upload_screenshot(self, screenshot_future: Future) -> Optional[str]:
+        """Upload the screenshot once it has been captured."""
+        screenshot_path = screenshot_future.result()
+        if not screenshot_path:
+            return None
+        
+        if self.verbose:
+            print("📤 Uploading screenshot...")
+        uploader = ImageUploader(cache_file=self.config.screenshot_dir / 'upload_cache.json')
+        return uploader.upload_image(screenshot_path)
+    
+    def _open_browser(self, url: str):
+        """Open the chat page in the configured browser, falling back to the system default."""
+        import webbrowser
+        
+        try:
+            self.config.launch_browser(url)
+        except OSError:
+            # Configured browser isn't installed, use the system default.
+            # Try xdg-open directly before webbrowser.open, which scans $PATH
+            # for every known browser on first use.
+            try:
+                if not webbrowser.BackgroundBrowser('xdg-open').open(url):
+                    webbrowser.open(url)
+            except Exception as e:
+                print(f"⚠️ Failed to open browser: {e}")
+                print(f"💡 Please manually open: {url}")
+    
     def run(self):
         """Run the chat application."""
         print("🚀 CopyQ Chat Assistant - Starting...")
@@ -1019,24 +1694,29 @@ class CopyQChatApp:
         # Capture context
         context_data = self.capture_context()
         
-        print(f"📋 Context captured:")
-        print(f"  📝 Text: {context_data['selected_text'][:50]}..." if context_data['selected_text'] else "  📝 No text")
-        print(f"  📸 Screenshot: {'Yes' if context_data['screenshot_path'] else 'No'}")
-        print(f"  🔗 Image URL: {'Yes' if context_data['image_url'] else 'No'}")
+        _print_lines([
+            "📋 Context captured:",
+            f"  📝 Text: {context_data['selected_text'][:50]}..." if context_data['selected_text'] else "  📝 No text",
+            f"  📸 Screenshot: {'Yes' if context_data['screenshot_path'] else 'No'}",
+            f"  🔗 Image URL: {'Uploading in background' if context_data['screenshot_path'] else 'No'}",
+        ])
         
         # Start web server
         server = WebChatServer(self.config)
         server.context_data = context_data
-        
-        # Open browser
-        url = f"http://localhost:{self.config.port}"
-        print(f"🌐 Opening browser: {url}")
+        server.attach_upload(self.upload_future)
         
         try:
-            webbrowser.open(url)
-        except Exception as e:
-            print(f"⚠️ Failed to open browser: {e}")
-            print(f"💡 Please manually open: {url}")
+            server.bind()
+        except OSError as e:
+            print(f"❌ Server error: {e}")
+            return
+        
+        # Open browser in the background; the socket is already listening, so
+        # its first request just waits in the accept queue until the server runs
+        url = f"http://127.0.0.1:{self.config.port}"
+        print(f"🌐 Opening browser: {url}")
+        threading.Thread(target=self._open_browser, args=(url,), daemon=True).start()
         
         # Start server
         try:
@@ -1049,6 +1729,8 @@ class CopyQChatApp:
 
 def main():
     """Main entry point."""
+    import argparse
+    
     parser = argparse.ArgumentParser(
         description='CopyQ Chat Assistant - Modern Python Implementation',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1073,21 +1755,28 @@ Environment Variables:
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
     
     args = parser.parse_args()
+    _check_dependencies()
     
     # Create configuration
     config = Config.from_args(args)
     
     if args.verbose:
-        print(f"🔧 Configuration:")
-        print(f"  🤖 Model: {config.model}")
-        print(f"  🌐 Browser: {config.browser}")
-        print(f"  🔌 Port: {config.port}")
-        print(f"  📁 Screenshot dir: {config.screenshot_dir}")
-        print(f"  📚 History dir: {config.chat_history_dir}")
+        _print_lines([
+            "🔧 Configuration:",
+            f"  🤖 Model: {config.model}",
+            f"  🌐 Browser: {config.browser}",
+            f"  🔌 Port: {config.port}",
+            f"  📁 Screenshot dir: {config.screenshot_dir}",
+            f"  📚 History dir: {config.chat_history_dir}",
+        ])
     
     # Run application
-    app = CopyQChatApp(config)
-    app.run()
+    app = CopyQChatApp(config, verbose=args.verbose)
+    try:
+        app.run()
+    finally:
+        # The pool is process-wide, so only the entry point may close it
+        _CAPTURE_POOL.shutdown(wait=False, cancel_futures=True)
 
 
 if __name__ == '__main__':
@@ -35,6 +35,31 @@ pip install --upgrade pip
 echo "📚 Installing Python packages..."
 pip install -r requirements.txt
 
+# Download the chat page's markdown renderer and sanitizer (exact versions,
+# served by the app so the page loads no scripts from a CDN). Files that don't
+# match the pinned SHA-256 are deleted and replies are shown as plain text.
+# To pin a new version, download it from a trusted machine and record the
+# output of `sha256sum` here
+MARKDOWN_IT_URL="https://cdn.jsdelivr.net/npm/markdown-it@14.1.0/dist/markdown-it.min.js"
+MARKDOWN_IT_SHA256=""
+DOMPURIFY_URL="https://cdn.jsdelivr.net/npm/dompurify@3.1.6/dist/purify.min.js"
+DOMPURIFY_SHA256=""
+
+echo "📜 Downloading markdown scripts..."
+mkdir -p vendor
+if [ -z "$MARKDOWN_IT_SHA256" ] || [ -z "$DOMPURIFY_SHA256" ]; then
+    echo "⚠️ No pinned checksums set, chat replies will be shown as plain text"
+    rm -f vendor/markdown-it.min.js vendor/purify.min.js
+elif ! { curl -fsSL -o vendor/markdown-it.min.js "$MARKDOWN_IT_URL" \
+        && curl -fsSL -o vendor/purify.min.js "$DOMPURIFY_URL" \
+        && printf '%s  %s\n' \
+            "$MARKDOWN_IT_SHA256" vendor/markdown-it.min.js \
+            "$DOMPURIFY_SHA256" vendor/purify.min.js \
+            | sha256sum -c --quiet --strict; }; then
+    echo "⚠️ Download failed or checksum mismatch, chat replies will be shown as plain text"
+    rm -f vendor/markdown-it.min.js vendor/purify.min.js
+fi
+
 # Create necessary directories
 echo "📁 Creating directories..."
 mkdir -p ~/.copyq_screenshots
@@ -48,10 +73,10 @@ chmod +x copyq_chat.py
 # Test installation
 echo "🧪 Testing installation..."
 python3 -c "
-import requests
-import PIL
-import pyperclip
-import pynput
+import importlib
+from copyq_chat import _REQUIRED_MODULES
+for name in _REQUIRED_MODULES:
+    importlib.import_module(name)
 print('✅ All required packages imported successfully!')
 "
 